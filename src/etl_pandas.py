@@ -1,8 +1,34 @@
 import pandas as pd
-import re
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 from neo4j import GraphDatabase
 
+# separators between the ids (authors and topics) serialized in the publications CSV files
+NON_ID_PATTERN = r'[^0-9]+'
+
+# column types of the CSV files, ids are handled as strings
+AUTHORS_DTYPE = {
+    'author_id': 'string[pyarrow]', 
+    'FullName': 'string[pyarrow]', 
+    'HIndex': 'int32[pyarrow]', 
+    'research_sector': 'string[pyarrow]',
+}
+TOPICS_DTYPE = {
+    'topic_id': 'string[pyarrow]', 
+    'name': 'string[pyarrow]',
+}
+PUBLICATIONS_DTYPE = {
+    'PublicationId': 'string[pyarrow]', 
+    'authors': 'string[pyarrow]', 
+    'topics': 'string[pyarrow]', 
+    'publication_year': 'int32[pyarrow]', 
+    'Doi': 'string[pyarrow]',
+}
+
 class Neo4jConnection:
     """ Provides the methods to run queries against a given Neo4j db.
     
@@ -12,18 +38,42 @@ class Neo4jConnection:
     URI = "bolt://localhost:7687"
     USER = "neo4j"
     PWD = "12345678"
+
+    # driver settings
+    POOL_SIZE = 8
+    ACQUISITION_TIMEOUT = 60
+    FETCH_SIZE = 1000
+
+    # public counters of the updates reported in the query summaries
+    COUNTERS = (
+        'nodes_created', 'nodes_deleted', 
+        'relationships_created', 'relationships_deleted', 
+        'properties_set', 'labels_added', 'labels_removed', 
+        'indexes_added', 'indexes_removed', 
+        'constraints_added', 'constraints_removed', 
+        'system_updates',
+    )
     
-    def __init__(self):
+    def __init__(self, pool_size=POOL_SIZE):
         """ Default contructor.
         
+        Args.
+            pool_size (int) - Number of connections (and concurrent writers) to the db.
         """
         
         self.__uri = Neo4jConnection.URI
         self.__user = Neo4jConnection.USER
         self.__pwd = Neo4jConnection.PWD
+        self.__pool_size = pool_size
         self.__driver = None
+
+        # bookmarks shared by all the sessions, so each batch sees the writes of the previous ones
+        self.__bookmark_manager = GraphDatabase.bookmark_manager()
         try:
-            self.__driver = GraphDatabase.driver(self.__uri, auth=(self.__user, self.__pwd))
+            self.__driver = GraphDatabase.driver(self.__uri, auth=(self.__user, self.__pwd), 
+                                                 max_connection_pool_size=self.__pool_size,
+                                                 connection_acquisition_timeout=Neo4jConnection.ACQUISITION_TIMEOUT,
+                                                 fetch_size=Neo4jConnection.FETCH_SIZE)
         except Exception as e:
             print("Failed to create the driver:", e)
         
@@ -51,7 +101,7 @@ class Neo4jConnection:
         session = None
         response = None
         try: 
-            session = self.__driver.session(database=db) if db is not None else self.__driver.session() 
+            session = self.__session(db)
             response = list(session.run(query, parameters))
         except Exception as e:
             print("Query failed:", e)
@@ -60,74 +110,231 @@ class Neo4jConnection:
                 session.close()
         return response
 
+    def write(self, query, parameters=None, db=None):
+        """ Runs a write query in a managed transaction, discarding its records.
+        
+        Args.
+            query (string) - Cypher query.
+            parameters (object) -  Parameters of the query.
+            db (object) - db to run the query.
+        
+        Returns.
+            Counters of the updates made by the query.
+        """
+
+        assert self.__driver is not None, "Driver not initialized!"
+        session = None
+        totals = Counter()
+        try: 
+            session = self.__session(db)
+            self.__add_counters(totals, session.execute_write(lambda tx: tx.run(query, parameters).consume().counters))
+        except Exception as e:
+            print("Query failed:", e)
+        finally: 
+            if session is not None:
+                session.close()
+        return dict(totals)
+
+    def write_implicit(self, query, parameters=None, db=None):
+        """ Runs a write query in an implicit (auto-commit) transaction, discarding its records.
+        Required by queries batched on the server with CALL { ... } IN TRANSACTIONS.
+        
+        Args.
+            query (string) - Cypher query.
+            parameters (object) -  Parameters of the query.
+            db (object) - db to run the query.
+        
+        Returns.
+            Counters of the updates made by the query.
+        """
+
+        assert self.__driver is not None, "Driver not initialized!"
+        session = None
+        totals = Counter()
+        try: 
+            session = self.__session(db)
+            self.__add_counters(totals, session.run(query, parameters).consume().counters)
+        except Exception as e:
+            print("Query failed:", e)
+        finally: 
+            if session is not None:
+                session.close()
+        return dict(totals)
+
+    def write_parallel(self, query, rows, batch_size=10000, db=None):
+        """ Runs a write query in batches of rows, spread over concurrent sessions of the pool.
+        Each batch runs in its own managed transaction, so transient errors (e.g. deadlocks 
+        between concurrent writers) are retried by the driver.
+        
+        Args.
+            query (string) - Cypher query.
+            rows (list) - Rows to send as the query parameter.
+            batch_size (int) - Number of rows per transaction.
+            db (object) - db to run the query.
+        
+        Returns.
+            Counters of the updates made by all the batches.
+        """
+
+        assert self.__driver is not None, "Driver not initialized!"
+
+        # rows are split at least in as many batches as concurrent writers
+        batch_size = max(1, min(batch_size, -(-len(rows) // self.__pool_size)))
+        batches = [rows[start:start + batch_size] for start in range(0, len(rows), batch_size)]
+        totals = Counter()
+        try: 
+            with ThreadPoolExecutor(max_workers=self.__pool_size) as executor:
+                futures = [executor.submit(self.__write_batch, query, batch, db) for batch in batches]
+                for future in futures:
+                    self.__add_counters(totals, future.result())
+        except Exception as e:
+            print("Query failed:", e)
+        return dict(totals)
+
+    @staticmethod
+    def __add_counters(totals, counters):
+        """ Adds the non-zero public counters of a query summary to the running totals.
+        
+        Args.
+            totals (Counter) - Running totals, updated in place.
+            counters (SummaryCounters) - Counters of a query summary.
+        """
+
+        for name in Neo4jConnection.COUNTERS:
+            value = getattr(counters, name)
+            if value:
+                totals[name] += value
+
+    def __session(self, db=None):
+        """ Opens a session sharing the connection bookmarks.
+        
+        Args.
+            db (object) - db of the session.
+        
+        Returns.
+            Session object.
+        """
+
+        return self.__driver.session(database=db, bookmark_manager=self.__bookmark_manager)
+
+    def __write_batch(self, query, batch, db=None):
+        """ Runs a write query for a single batch of rows on its own session.
+        
+        Args.
+            query (string) - Cypher query.
+            batch (list) - Rows to send as the query parameter.
+            db (object) - db to run the query.
+        
+        Returns.
+            Counters of the updates made by the batch.
+        """
+
+        session = self.__session(db)
+        try: 
+            return session.execute_write(lambda tx: tx.run(query, rows=batch).consume().counters)
+        finally: 
+            session.close()
+
 
 def get_authors():
     """ Retrieve and process data about authors serialized in CSV file.
     
     """
 
-    authors = pd.read_csv('data/authors.csv')
+    # author id and research sector id read as strings
+    authors = pd.read_csv('data/authors.csv', usecols=list(AUTHORS_DTYPE),
+                          dtype=AUTHORS_DTYPE, engine='pyarrow', dtype_backend='pyarrow')
     
     # streamline column names
     authors.columns = ['author_id', 'full_name', 'h_index', 'research_sector']
     
-    # author id and research sector id casted to strings
-    authors.author_id = authors.author_id.astype(str)
-    authors.research_sector = authors.research_sector.astype(str)
-    
     return authors
 
 
-def get_topics():
+def get_topics(publications, incoming_publications):
     """ Retrieve and process data about topics serialized in CSV file.
     Only topics mentioned in the published and incoming publications are loaded.
     
+    Args.
+        publications (Pandas DataFrame) - Processed publications.
+        incoming_publications (Pandas DataFrame) - Processed incoming publications.
     """
 
-    topics = pd.read_csv('data/topics.csv')
+    # topic id read as string
+    topics = pd.read_csv('data/topics.csv', usecols=list(TOPICS_DTYPE),
+                         dtype=TOPICS_DTYPE, engine='pyarrow', dtype_backend='pyarrow')
     
     # streamline column names
     topics.columns = ['topic_id', 'name']
-    
-    # topic id casted to string
-    topics.topic_id = topics.topic_id.astype(str)
 
     # fill null value on topic with topic_id = 164917456
-    topics.name.fillna('Not Available', inplace=True)
-
-    # get publications data
-    publications = get_publications()
-    incoming_publications = get_incoming_publications()
+    topics.name = pd.arrays.ArrowExtensionArray(pc.fill_null(pa.array(topics.name), 'Not Available'))
 
-    # creates a set of the publications topics (both published and incoming ones)
-    pub_topics = set(pd.concat([publications, incoming_publications]).topic_list.explode())
+    # unique publications topics (both published and incoming ones)
+    pub_topics = pd.concat([publications.topic_list, incoming_publications.topic_list]).explode().unique()
 
     # only get details of topics mentioned on publications
-    pub_topic_details = topics[topics.topic_id.apply(lambda x: x in pub_topics)]
+    pub_topic_details = topics[topics.topic_id.isin(pub_topics)]
 
     return pub_topic_details
 
 
-def get_publications():
-    """ Retrieve and process data about publications serialized in CSV file. 
+def extract_ids(values):
+    """ Extract the ids serialized in each string of a column as a list of strings.
+    Runs as pyarrow compute kernels over the whole column.
+    
+    Args.
+        values (Pandas Series) - Strings with the serialized ids.
+    
+    Returns.
+        Pandas array of lists of ids.
+    """
+
+    # ids separated by single spaces, with no leading or trailing ones
+    ids = pc.ascii_trim_whitespace(pc.replace_substring_regex(pa.array(values), NON_ID_PATTERN, ' '))
+
+    # strings with no ids are split into empty lists
+    ids = pc.if_else(pc.equal(ids, ''), pa.scalar(None, pa.string()), ids)
+    id_lists = pc.ascii_split_whitespace(ids)
+    id_lists = pc.fill_null(id_lists, pa.scalar([], id_lists.type))
+
+    return pd.arrays.ArrowExtensionArray(id_lists)
+
+
+def iter_publications(path, chunksize=200000):
+    """ Retrieve and process data about publications serialized in CSV file, chunk by chunk.
+    The raw lists of each chunk are released once their ids are extracted.
+    
+    Args.
+        path (string) - Path of the publications CSV file.
+        chunksize (int) - Number of rows per chunk.
     
+    Yields.
+        Pandas DataFrame with the processed publications of a chunk.
     """
 
-    publications = pd.read_csv('data/publications.csv')
+    # publication id read as string
+    for chunk in pd.read_csv(path, usecols=list(PUBLICATIONS_DTYPE), dtype=PUBLICATIONS_DTYPE, 
+                             chunksize=chunksize, dtype_backend='pyarrow'):
     
-    # streamline column names
-    publications.columns = ['publication_id', 'author_list', 'topic_list', 'publication_year', 'doi']
+        # streamline column names
+        chunk.columns = ['publication_id', 'author_list', 'topic_list', 'publication_year', 'doi']
+
+        # author id extracted as list of strings
+        chunk.author_list = extract_ids(chunk.author_list)
 
-    # publication id casted to string
-    publications.publication_id = publications.publication_id.astype(str)
+        # topic id extracted as list of strings
+        chunk.topic_list = extract_ids(chunk.topic_list)
 
-    # author id extracted as list of strings
-    publications.author_list = publications.author_list.apply(lambda x: re.findall(r'\d+', x))
+        yield chunk
 
-    # topic id extracted as list of strings
-    publications.topic_list = publications.topic_list.apply(lambda x: re.findall(r'\d+', x))
+
+def get_publications():
+    """ Retrieve and process data about publications serialized in CSV file. 
     
-    return publications
+    """
+
+    return pd.concat(iter_publications('data/publications.csv'))
 
 
 def get_incoming_publications():
@@ -135,21 +342,24 @@ def get_incoming_publications():
     
     """
 
-    incoming_publications = pd.read_csv('data/incoming_publications.csv')
-    
-    # streamline column names
-    incoming_publications.columns = ['publication_id', 'author_list', 'topic_list', 'publication_year', 'doi']
-
-    # publication id casted to string
-    incoming_publications.publication_id = incoming_publications.publication_id.astype(str)
+    return pd.concat(iter_publications('data/incoming_publications.csv'))
 
-    # author id extracted as list of strings
-    incoming_publications.author_list = incoming_publications.author_list.apply(lambda x: re.findall(r'\d+', x))
 
-    # topic id extracted as list of strings
-    incoming_publications.topic_list = incoming_publications.topic_list.apply(lambda x: re.findall(r'\d+', x))    
+def remap_authors(publications_list, remap):
+    """ Replace in place the author ids of the publications authors lists.
     
-    return incoming_publications
+    Args.
+        publications_list (list) - Pandas DataFrames of publications to update.
+        remap (dict) - Author id to replace -> author id replacing it.
+    """
+
+    get = remap.get
+    for publications in publications_list:
+        author_lists = [[get(a, a) for a in x] for x in publications.author_list.to_numpy()]
+
+        # kept as the Arrow list column built by extract_ids
+        publications.author_list = pd.arrays.ArrowExtensionArray(
+            pa.array(author_lists, type=publications.author_list.dtype.pyarrow_dtype))
 
 
 def cleaned_authors_publications():
@@ -169,33 +379,65 @@ def cleaned_authors_publications():
     # for each duplicated author: 
     # the author data record with highest h_index will be kept
     # in the publication and the incoming_publications data, 
-    # the author_id with the remaining h_index will be replaced by the other one
-    for name in set(duplicated.full_name):
-    
-        # index of the row of a duplicated author with highest h_index
-        to_keep = authors.query(f"full_name == '{name}'").h_index.idxmax()
-        id_to_keep = authors.loc[to_keep].author_id
+    # the author_ids of the remaining records will be replaced by the kept one
+
+    # for each row of a duplicated author, index of the row with highest h_index
+    to_keep = duplicated.groupby('full_name').h_index.transform('idxmax')
 
-        # index of the row of a duplicated author with lowest h_index
-        to_remove = authors.query(f"full_name == '{name}'").iloc[::-1].h_index.idxmin()
-        id_to_remove = authors.loc[to_remove].author_id
+    # index of the rows of duplicated authors not being kept
+    to_remove = duplicated.index[duplicated.index != to_keep]
 
-        # remove authors record with the lowest h_index
-        authors.drop(to_remove, inplace = True)
+    # author_id to replace -> author_id to keep
+    remap = dict(zip(authors.author_id[to_remove], authors.author_id[to_keep[to_remove]]))
 
-        # in publication data, author_id with the lowest h_inde is replaced 
-        publications.author_list = publications.author_list.apply(lambda x: 
-                                                                    list(map(lambda y:
-                                                                            y.replace(id_to_remove, id_to_keep), x)))
+    # no duplicated authors, nothing to clean
+    if not remap:
+        return authors, publications, incoming_publications
 
-        # in incoming_publication data, author_id with the lowest h_inde is replaced 
-        incoming_publications.author_list = incoming_publications.author_list.apply(lambda x: 
-                                                                                            list(map(lambda y:
-                                                                                                    y.replace(id_to_remove, id_to_keep), x)))
+    # remove authors records with the lowest h_index
+    authors = authors.drop(to_remove)
+
+    # in publication and incoming_publication data, author_ids with the lowest h_index are replaced 
+    remap_authors([publications, incoming_publications], remap)
 
     return authors, publications, incoming_publications
 
 
+def to_rows(df):
+    """ Convert a DataFrame into the list of rows sent as a query parameter.
+    Rows are zipped straight from the values tuples, skipping the per-value checks of to_dict.
+    
+    Args.
+        df (Pandas DataFrame) - Data to convert.
+    
+    Returns.
+        List of dicts, one per row, keyed by column name.
+    """
+
+    columns = list(df.columns)
+    return [dict(zip(columns, row)) for row in df.itertuples(index=False, name=None)]
+
+
+def setup_constraints(conn):
+    """ Run the queries to create the uniqueness constraints (and their backing indexes) 
+    on the ids the nodes are merged and matched by.
+    
+    Args.
+        conn (connection object) - Connection to run the queries.
+    """
+
+    constraints = [
+        ('author_id', 'Author'),
+        ('topic_id', 'Topic'),
+        ('publication_id', 'Publication'),
+    ]
+    for prop, label in constraints:
+        conn.write(f'''
+                   CREATE CONSTRAINT {prop} IF NOT EXISTS 
+                   FOR (n: {label}) REQUIRE n.{prop} IS UNIQUE
+                   ''')
+
+
 def load_authors(conn, authors):
     """ Run the query to load the authors in the graph db.
     
@@ -204,23 +446,24 @@ def load_authors(conn, authors):
         authors (Pandas DataFrame) - Authors to load. 
     
     Return.
-        Number of authors loaded.
+        Counters of the updates made in the graph db.
     """
 
     query = '''
             UNWIND $rows AS row
-            MERGE (t: Author 
-                {
-                    author_id: row.author_id, 
-                    full_name: row.full_name,
-                    h_index: row.h_index, 
-                    research_sector: row.research_sector
-                }
-            )
-            
-            RETURN count(*) as total
+            CALL {
+                WITH row
+                MERGE (t: Author 
+                    {
+                        author_id: row.author_id
+                    }
+                )
+                SET t.full_name = row.full_name,
+                    t.h_index = row.h_index, 
+                    t.research_sector = row.research_sector
+            } IN TRANSACTIONS OF 5000 ROWS
             '''
-    return conn.query(query, parameters = {'rows':authors.to_dict('records')})
+    return conn.write_implicit(query, parameters = {'rows':to_rows(authors)})
 
 
 def load_topics(conn, topics):
@@ -231,21 +474,22 @@ def load_topics(conn, topics):
         topics (Pandas DataFrame) - Topics to load. 
     
     Return.
-        Number of topics loaded.
+        Counters of the updates made in the graph db.
     """
 
     query = '''
             UNWIND $rows AS row
-            MERGE (t: Topic 
-                {
-                    topic_id: row.topic_id,
-                    name: row.name
-                }
-            )
-            
-            RETURN count(*) as total
+            CALL {
+                WITH row
+                MERGE (t: Topic 
+                    {
+                        topic_id: row.topic_id
+                    }
+                )
+                SET t.name = row.name
+            } IN TRANSACTIONS OF 5000 ROWS
             '''
-    return conn.query(query, parameters = {'rows':topics.to_dict('records')})
+    return conn.write_implicit(query, parameters = {'rows':to_rows(topics)})
     
 
 def load_publications(conn, publications):
@@ -256,41 +500,27 @@ def load_publications(conn, publications):
         publications (Pandas DataFrame) - Publications to load. 
     
     Return.
-        Number of publications loaded.
+        Counters of the updates made in the graph db.
     """
 
     query = '''
             UNWIND $rows AS row
             MERGE (p: Publication 
                 {
-                    publication_id: row.publication_id, 
-                    publication_year: row.publication_year, 
-                    doi: row.doi, 
-                    status: "published"
+                    publication_id: row.publication_id
                 }
             )
+            SET p.publication_year = row.publication_year, 
+                p.doi = row.doi, 
+                p.status = "published"
+            '''
+    counters = Counter(conn.write_parallel(query, to_rows(publications[['publication_id', 'publication_year', 'doi']])))
 
-            WITH distinct row, p
-            UNWIND row.author_list AS a_id
-            MATCH (a: Author 
-                {
-                    author_id: a_id
-                }
-            )
-            MERGE (a)-[:WRITES]->(p)
+    # relationships loaded once all the publication nodes exist
+    counters.update(load_writes(conn, publications))
+    counters.update(load_is_about(conn, publications))
 
-            WITH row, p
-            UNWIND row.topic_list AS t_id
-            MATCH (t: Topic 
-                {
-                    topic_id: t_id
-                }
-            )
-            MERGE (p)-[:IS_ABOUT]->(t)
-            
-            RETURN count(distinct p) as total
-            '''
-    return conn.query(query, parameters = {'rows':publications.to_dict('records')})
+    return dict(counters)
 
 
 def load_incoming_publications(conn, incoming_publications):
@@ -301,41 +531,95 @@ def load_incoming_publications(conn, incoming_publications):
         incoming_publications (Pandas DataFrame) - Incoming publications to load. 
     
     Return.
-        Number of incoming publications loaded.
+        Counters of the updates made in the graph db.
     """
 
     query = '''
             UNWIND $rows AS row
             MERGE (p: Publication 
                 {
-                    publication_id: row.publication_id, 
-                    publication_year: row.publication_year, 
-                    doi: row.doi, 
-                    status: "published"
+                    publication_id: row.publication_id
                 }
             )
+            SET p.publication_year = row.publication_year, 
+                p.doi = row.doi, 
+                p.status = "published"
+            '''
+    counters = Counter(conn.write_parallel(query, to_rows(incoming_publications[['publication_id', 'publication_year', 'doi']])))
+
+    # relationships loaded once all the publication nodes exist
+    counters.update(load_writes(conn, incoming_publications))
+    counters.update(load_is_about(conn, incoming_publications))
 
-            WITH distinct row, p
-            UNWIND row.author_list AS a_id
+    return dict(counters)
+
+
+def load_writes(conn, publications):
+    """ Run the query to load the relationships between the publications and their authors 
+    in the graph db.
+    
+    Args.
+        conn (connection object) - Connection to run the query.
+        publications (Pandas DataFrame) - Publications whose authors relationships to load. 
+    
+    Return.
+        Counters of the updates made in the graph db.
+    """
+
+    query = '''
+            UNWIND $rows AS row
             MATCH (a: Author 
                 {
-                    author_id: a_id
+                    author_id: row.author_id
+                }
+            )
+            MATCH (p: Publication 
+                {
+                    publication_id: row.publication_id
                 }
             )
             MERGE (a)-[:WRITES]->(p)
+            '''
+
+    # one (publication_id, author_id) pair per row
+    pairs = publications[['publication_id', 'author_list']].explode('author_list').dropna()
+    pairs.columns = ['publication_id', 'author_id']
+
+    return conn.write_parallel(query, to_rows(pairs))
+
+
+def load_is_about(conn, publications):
+    """ Run the query to load the relationships between the publications and their topics 
+    in the graph db.
+    
+    Args.
+        conn (connection object) - Connection to run the query.
+        publications (Pandas DataFrame) - Publications whose topics relationships to load. 
+    
+    Return.
+        Counters of the updates made in the graph db.
+    """
 
-            WITH row, p
-            UNWIND row.topic_list AS t_id
+    query = '''
+            UNWIND $rows AS row
+            MATCH (p: Publication 
+                {
+                    publication_id: row.publication_id
+                }
+            )
             MATCH (t: Topic 
                 {
-                    topic_id: t_id
+                    topic_id: row.topic_id
                 }
             )
             MERGE (p)-[:IS_ABOUT]->(t)
-            
-            RETURN count(distinct p) as total
             '''
-    return conn.query(query, parameters = {'rows':incoming_publications.to_dict('records')})
+
+    # one (publication_id, topic_id) pair per row
+    pairs = publications[['publication_id', 'topic_list']].explode('topic_list').dropna()
+    pairs.columns = ['publication_id', 'topic_id']
+
+    return conn.write_parallel(query, to_rows(pairs))
 
 
 if __name__ == "__main__":
@@ -343,6 +627,9 @@ if __name__ == "__main__":
     # creates the connection to the graph db.
     conn = Neo4jConnection()
 
+    # create the constraints on the nodes ids before loading them
+    setup_constraints(conn)
+
     # get cleaned authors, publications, and incoming publications
     authors, publications, incoming_publications = cleaned_authors_publications() 
 
@@ -352,7 +639,7 @@ if __name__ == "__main__":
 
     # load topics
     print("Loading Topics ...")
-    topics = get_topics()
+    topics = get_topics(publications, incoming_publications)
     print(load_topics(conn, topics))
 
     # load publications